@@ -1,6 +1,7 @@
 import shutil
 import warnings
 from pathlib import Path
+from time import perf_counter
 
 import demucs.separate
 import librosa
@@ -27,9 +28,14 @@ def read_audio_file(input_file_path: Path) -> tuple[np.ndarray, np.ndarray, floa
     return time, y.astype(np.float32), sample_rate
 
 
+def get_audio_duration(input_file_path: Path) -> float:
+    return librosa.get_duration(path=input_file_path)
+
+
 def extract_drums(
     input_file_path: Path, skip_cache=False
-) -> tuple[tuple[np.ndarray, np.ndarray, float], Path]:
+) -> tuple[tuple[np.ndarray, np.ndarray, float], Path, float | None]:
+    # also returns how long the separation took, or None if the drum track was already there
     try:
         torch.cuda.init()
     except Exception:
@@ -46,6 +52,7 @@ def extract_drums(
         input_file_path.parent / f"{input_file_path.stem}_drums.wav"
     )
 
+    separation_time = None
     if skip_cache or not extracted_drums_file_path.exists():
         print(f"Separating drum track from \'{input_file_path}\'")
         temp_file_path = (
@@ -55,6 +62,7 @@ def extract_drums(
             / "drums.wav"
         )
         print("Isolating drums with Demucs...")
+        separation_start = perf_counter()
         demucs.separate.main(
             [
                 "--two-stems",
@@ -66,11 +74,16 @@ def extract_drums(
                 input_file_path.as_posix(),
             ]
         )
+        separation_time = perf_counter() - separation_start
         shutil.copy(temp_file_path, extracted_drums_file_path)
         shutil.rmtree(temp_file_path.parent)
         torch.cuda.empty_cache()
 
-    return read_audio_file(extracted_drums_file_path), extracted_drums_file_path
+    return (
+        read_audio_file(extracted_drums_file_path),
+        extracted_drums_file_path,
+        separation_time,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,296 @@
+import hashlib
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+import librosa
+import numpy as np
+
+FINGERPRINT_SAMPLE_RATE = 11025
+FINGERPRINT_HOP_LENGTH = 512  # ~46ms per frame
+FINGERPRINT_SMOOTHING_IN_FRAMES = 8  # ~0.37s
+FINGERPRINT_BITS = 24
+MAX_OFFSET_IN_FRAMES = 216  # ~10s of leading silence / intro difference between uploads
+MIN_SIMILARITY = 0.85
+MIN_DURATION_RATIO = 0.9
+# lookup table: only every few frames of the indexed recordings, the query uses all of its frames so offsets still line up
+INDEX_STEP_IN_FRAMES = 4
+MAX_HITS_PER_HASH = 2000  # very common sub-fingerprints (silence etc.) say nothing about the recording
+MIN_VOTES = 10
+MAX_CANDIDATES = 5
+
+
+class RecordingMatch(NamedTuple):
+    drums_path: Path
+    sources: list[str]
+    separation_time: float | None
+    results: dict[str, dict]
+    similarity: float
+    time_offset: float
+
+
+def compute_fingerprint(input_file_path: Path) -> np.ndarray:
+    # computed on the mixture, at low sample rate so that it stays cheap compared to the separation
+    y, sample_rate = librosa.load(
+        input_file_path, sr=FINGERPRINT_SAMPLE_RATE, mono=True
+    )
+    chroma = librosa.feature.chroma_stft(
+        y=y,
+        sr=sample_rate,
+        n_fft=4 * FINGERPRINT_HOP_LENGTH,
+        hop_length=FINGERPRINT_HOP_LENGTH,
+    )
+
+    # Fine hop + smoothing over several frames: an upload whose lead-in is not a multiple of the hop only moves the
+    # frame grid by a small fraction of the smoothing window, so the bits below barely change.
+    kernel = np.ones(FINGERPRINT_SMOOTHING_IN_FRAMES) / FINGERPRINT_SMOOTHING_IN_FRAMES
+    chroma = np.apply_along_axis(np.convolve, 1, chroma, kernel, mode="valid")
+
+    # Landmark-ish approach: per frame, which pitch classes gain energy w.r.t. the previous (smoothed) frame & which
+    # ones dominate. Only relative comparisons are kept, so it survives re-encoding, different bitrates, volume, etc.
+    lag = FINGERPRINT_SMOOTHING_IN_FRAMES
+    rising = chroma[:, lag:] > chroma[:, :-lag]
+    dominant = chroma[:, lag:] > np.median(chroma[:, lag:], axis=0)
+    bits = np.vstack([rising, dominant]).astype(np.uint32)
+
+    return (bits << np.arange(FINGERPRINT_BITS, dtype=np.uint32)[:, None]).sum(
+        axis=0, dtype=np.uint32
+    )
+
+
+def get_fingerprint_similarity(
+    fingerprint_a: np.ndarray,
+    fingerprint_b: np.ndarray,
+    max_offset_in_frames: int = MAX_OFFSET_IN_FRAMES,
+    offsets: Iterable[int] | None = None,
+) -> tuple[float, int]:
+    # best (1 - bit error rate) over the given time offsets (all the allowed ones by default), and the offset (in frames)
+    # it was found at: a positive one means the content of b starts that many frames later in a.
+    # Unrelated recordings are around 0.5
+
+    # the longer one may have up to max_offset_in_frames of extra intro, don't count that as a duration mismatch
+    shorter, longer = sorted((len(fingerprint_a), len(fingerprint_b)))
+    if shorter < MIN_DURATION_RATIO * (longer - max_offset_in_frames):
+        return 0.0, 0
+
+    if offsets is None:
+        offsets = range(-max_offset_in_frames, max_offset_in_frames + 1)
+
+    best_similarity, best_offset = 0.0, 0
+    for offset in offsets:
+        a = fingerprint_a[max(0, offset) :]
+        b = fingerprint_b[max(0, -offset) :]
+        n = min(len(a), len(b))
+        if n == 0:
+            continue
+
+        differing_bits = np.unpackbits(np.bitwise_xor(a[:n], b[:n]).view(np.uint8))
+        similarity = 1 - differing_bits.sum() / (n * FINGERPRINT_BITS)
+        if similarity > best_similarity:
+            best_similarity, best_offset = similarity, offset
+
+    return float(best_similarity), best_offset
+
+
+def frames_to_seconds(frames: int) -> float:
+    return frames * FINGERPRINT_HOP_LENGTH / FINGERPRINT_SAMPLE_RATE
+
+
+# Index layout (in fingerprint_index/):
+#   recordings.json: metadata of each separated recording (drum track, sources, separation time, analysis results)
+#   <recording id>.npy: its full fingerprint
+#   hashes.npz: lookup table of sub-fingerprints (sorted), with the recording & frame each one was found at
+def get_index_dir() -> Path:
+    return Path.cwd().resolve() / "fingerprint_index"
+
+
+def _get_recording_id(drums_path: Path) -> str:
+    return hashlib.sha1(str(drums_path.resolve()).encode()).hexdigest()[:16]
+
+
+def _load_recordings(index_dir: Path) -> dict:
+    recordings_file = index_dir / "recordings.json"
+    if recordings_file.exists():
+        with open(recordings_file, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_recordings(index_dir: Path, recordings: dict):
+    index_dir.mkdir(exist_ok=True)
+    with open(index_dir / "recordings.json", "w") as f:
+        json.dump(recordings, f, indent=2)
+
+
+def _load_lookup_table(index_dir: Path) -> dict[str, np.ndarray]:
+    hashes_file = index_dir / "hashes.npz"
+    if hashes_file.exists():
+        with np.load(hashes_file) as data:
+            return dict(data)
+    return {
+        "recording_ids": np.array([], dtype="<U16"),
+        "hashes": np.array([], dtype=np.uint32),
+        "recordings": np.array([], dtype=np.uint32),
+        "frames": np.array([], dtype=np.uint32),
+    }
+
+
+def _add_to_lookup_table(
+    index_dir: Path, recording_id: str, fingerprint: np.ndarray
+):
+    table = _load_lookup_table(index_dir)
+
+    recording_ids = table["recording_ids"]
+    if recording_id in recording_ids:
+        # re-indexed: drop its previous sub-fingerprints
+        recording = np.flatnonzero(recording_ids == recording_id)[0]
+        keep = table["recordings"] != recording
+        hashes, recordings, frames = (
+            table[k][keep] for k in ("hashes", "recordings", "frames")
+        )
+    else:
+        recording = len(recording_ids)
+        recording_ids = np.append(recording_ids, recording_id)
+        hashes, recordings, frames = (
+            table[k] for k in ("hashes", "recordings", "frames")
+        )
+
+    new_frames = np.arange(
+        0, len(fingerprint), INDEX_STEP_IN_FRAMES, dtype=np.uint32
+    )
+    hashes = np.concatenate([hashes, fingerprint[new_frames]])
+    recordings = np.concatenate(
+        [recordings, np.full(len(new_frames), recording, dtype=np.uint32)]
+    )
+    frames = np.concatenate([frames, new_frames])
+
+    order = np.argsort(hashes, kind="stable")
+    np.savez(
+        index_dir / "hashes.npz",
+        recording_ids=recording_ids,
+        hashes=hashes[order],
+        recordings=recordings[order],
+        frames=frames[order],
+    )
+
+
+def _get_candidates(
+    index_dir: Path, fingerprint: np.ndarray
+) -> list[tuple[str, int]]:
+    # Every sub-fingerprint of the query found in the lookup table votes for a (recording, offset) pair. The same
+    # recording gets lots of votes at the right offset, unrelated ones only scattered ones.
+    table = _load_lookup_table(index_dir)
+    hashes = table["hashes"]
+
+    left = np.searchsorted(hashes, fingerprint, side="left")
+    right = np.searchsorted(hashes, fingerprint, side="right")
+    counts = right - left
+    counts[counts > MAX_HITS_PER_HASH] = 0
+    if counts.sum() == 0:
+        return []
+
+    query_frames = np.repeat(np.arange(len(fingerprint)), counts)
+    positions = np.repeat(left - np.cumsum(counts) + counts, counts) + np.arange(
+        counts.sum()
+    )
+    offsets = query_frames - table["frames"][positions].astype(np.int64)
+    recordings = table["recordings"][positions].astype(np.int64)
+
+    allowed = np.abs(offsets) <= MAX_OFFSET_IN_FRAMES
+    keys = recordings[allowed] * (2 * MAX_OFFSET_IN_FRAMES + 1) + (
+        offsets[allowed] + MAX_OFFSET_IN_FRAMES
+    )
+    keys, votes = np.unique(keys, return_counts=True)
+
+    candidates = {}
+    for i in np.argsort(votes)[::-1]:
+        if votes[i] < MIN_VOTES or len(candidates) == MAX_CANDIDATES:
+            break
+        recording, offset = divmod(int(keys[i]), 2 * MAX_OFFSET_IN_FRAMES + 1)
+        recording_id = str(table["recording_ids"][recording])
+        if recording_id not in candidates:
+            candidates[recording_id] = offset - MAX_OFFSET_IN_FRAMES
+
+    return list(candidates.items())
+
+
+def find_matching_recording(
+    fingerprint: np.ndarray, min_similarity: float = MIN_SIMILARITY
+) -> RecordingMatch | None:
+    index_dir = get_index_dir()
+    recordings = _load_recordings(index_dir)
+    best_match = None
+
+    for recording_id, candidate_offset in _get_candidates(index_dir, fingerprint):
+        entry = recordings.get(recording_id)
+        if entry is None or not Path(entry["drums_path"]).exists():
+            continue
+
+        # full check only around the voted offset, votes may be split between neighbouring frames
+        similarity, offset = get_fingerprint_similarity(
+            fingerprint,
+            np.load(index_dir / f"{recording_id}.npy"),
+            offsets=range(candidate_offset - 2, candidate_offset + 3),
+        )
+        if similarity >= min_similarity and (
+            best_match is None or similarity > best_match.similarity
+        ):
+            best_match = RecordingMatch(
+                Path(entry["drums_path"]),
+                entry["sources"],
+                entry["separation_time"],
+                entry["results"],
+                similarity,
+                frames_to_seconds(offset),
+            )
+
+    return best_match
+
+
+def register_recording(
+    fingerprint: np.ndarray,
+    source: Path,
+    drums_path: Path,
+    separation_time: float | None,
+):
+    index_dir = get_index_dir()
+    recordings = _load_recordings(index_dir)
+    recording_id = _get_recording_id(drums_path)
+
+    entry = recordings.setdefault(
+        recording_id,
+        {
+            "drums_path": str(drums_path.resolve()),
+            "sources": [],
+            "separation_time": separation_time,
+            "results": {},
+        },
+    )
+    # None when the drum track was already there, keep whatever is known about the original separation
+    if separation_time is not None:
+        entry["separation_time"] = separation_time
+    if str(source.resolve()) not in entry["sources"]:
+        entry["sources"].append(str(source.resolve()))
+
+    _save_recordings(index_dir, recordings)
+    np.save(index_dir / f"{recording_id}.npy", fingerprint.astype(np.uint32))
+    _add_to_lookup_table(index_dir, recording_id, fingerprint.astype(np.uint32))
+
+
+def register_result(
+    drums_path: Path, source: Path, analysis_key: str, result: dict
+):
+    # result on the drum track's own timeline, every duplicate gets its own shifted copy of it
+    index_dir = get_index_dir()
+    recordings = _load_recordings(index_dir)
+
+    entry = recordings.get(_get_recording_id(drums_path))
+    if entry is None:
+        return
+
+    if str(source.resolve()) not in entry["sources"]:
+        entry["sources"].append(str(source.resolve()))
+    entry["results"][analysis_key] = result
+
+    _save_recordings(index_dir, recordings)
@@ -36,6 +36,7 @@ if __name__ == "__main__":
     parser.add_argument("csv_path", type=Path)
     args = parser.parse_args()
 
+    deduplicated, unknown_separation_time, saved_separation_time = 0, 0, 0.0
     for row in load_rows(args.csv_path):
         src = row["src"].strip()
         file_path = None
@@ -69,9 +70,28 @@ if __name__ == "__main__":
                     row, "snare_drum_range_start", "snare_drum_range_end"
                 ),
                 "min_consecutive_hits": parse_int(row, "min_consecutive_hits"),
+                "frequency_tracking_horizon_in_seconds": parse_float(
+                    row, "frequency_tracking_horizon_in_seconds"
+                ),
             }.items()
             if v is not None
         }
 
-        process_song(file_path, **kwargs)
+        report = process_song(file_path, **kwargs)
+        if report.deduplicated_from is not None:
+            deduplicated += 1
+            if report.saved_separation_time is None:
+                unknown_separation_time += 1
+            else:
+                saved_separation_time += report.saved_separation_time
         print("-----")
+
+    print(
+        f"Deduplication: {deduplicated} song(s) matched an already separated recording, "
+        f"saving ~{saved_separation_time:.1f}s of drum separation"
+        + (
+            f" (+{unknown_separation_time} separated before timing was recorded)."
+            if unknown_separation_time
+            else "."
+        )
+    )
@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from zipfile import ZipFile
 
 import numpy as np
@@ -13,15 +14,17 @@ def compress_to_mp3(wav_path: Path, bitrate: str = "192k") -> Path:
     return mp3_path
 
 
-def save_result(
+def get_result_path(filepath: Path, output_dir: str) -> str:
+    return f"{output_dir}/{filepath.stem.replace(' ', '_').replace('-', '_')}.zip"
+
+
+def get_result(
     time: np.ndarray,
     ranges_to_highlight: list[tuple[int, int]],
     snare_frequency: float,
     bass_drum_frequency: float,
-    filepath: Path,
-    drumtrack_path: Path,
-    output_dir: str,
-):
+    tracked_frequencies: list[tuple[int, int, float, float]] | None = None,
+) -> dict:
     output = {
         "blast_beats": [],
         "snare_frequency": snare_frequency,
@@ -33,16 +36,94 @@ def save_result(
             {"start_time": float(time[start]), "end_time": float(time[end - 1])}
         )
 
-    mp3_drumtrack_path = compress_to_mp3(drumtrack_path)
+    if tracked_frequencies is not None:
+        # only report where the tracked frequencies change, one entry per section would be way too verbose
+        output["tracked_frequencies"] = []
+        for start, end, bass_drum_freq, snare_freq in tracked_frequencies:
+            last = (output["tracked_frequencies"] or [None])[-1]
+            if (
+                last is not None
+                and last["bass_drum_frequency"] == bass_drum_freq
+                and last["snare_frequency"] == snare_freq
+            ):
+                last["end_time"] = float(time[min(end, len(time)) - 1])
+                continue
+            output["tracked_frequencies"].append(
+                {
+                    "start_time": float(time[start]),
+                    "end_time": float(time[min(end, len(time)) - 1]),
+                    "bass_drum_frequency": float(bass_drum_freq),
+                    "snare_frequency": float(snare_freq),
+                }
+            )
 
-    zip_path = f"{output_dir}/{filepath.stem.replace(' ', '_').replace('-', '_')}.zip"
-    with ZipFile(zip_path, "w") as zipf:
-        zipf.writestr(
-            f"{filepath.stem.replace(' ', '_').replace('-', '_')}.json",
-            json.dumps(output, indent=4),
-        )
-        zipf.write(filepath, arcname=filepath.name)
-        zipf.write(mp3_drumtrack_path, arcname=mp3_drumtrack_path.name)
+    return output
+
+
+def shift_result(output: dict, time_offset: float, duration: float) -> dict:
+    # Results are computed on the drum track's timeline. A duplicate of the recording it was separated from may start
+    # time_offset seconds later (or earlier, if negative) & last duration seconds: move everything onto its timeline,
+    # dropping/clipping what falls outside of it.
+    shifted = dict(output)
+    for key in ("blast_beats", "tracked_frequencies"):
+        if key not in output:
+            continue
+        shifted[key] = [
+            {
+                **entry,
+                "start_time": max(0.0, entry["start_time"] + time_offset),
+                "end_time": min(duration, entry["end_time"] + time_offset),
+            }
+            for entry in output[key]
+            if entry["end_time"] + time_offset > 0
+            and entry["start_time"] + time_offset < duration
+        ]
+    return shifted
+
+
+def shift_drumtrack(
+    drumtrack_path: Path, time_offset: float, duration: float, output_path: Path
+) -> Path:
+    # same as shift_result, for the audio: pad with silence or cut the beginning, and cut what goes past the end
+    audio = AudioSegment.from_wav(drumtrack_path)
+    offset_in_ms = round(time_offset * 1000)
+    if offset_in_ms > 0:
+        audio = AudioSegment.silent(offset_in_ms, frame_rate=audio.frame_rate) + audio
+    else:
+        audio = audio[-offset_in_ms:]
+    audio[: round(duration * 1000)].export(output_path, format="wav")
+    return output_path
+
+
+def save_result(
+    output: dict,
+    filepath: Path,
+    drumtrack_path: Path,
+    output_dir: str,
+    time_offset: float = 0.0,
+    duration: float | None = None,
+):
+    # time_offset & duration: the drum track may come from a duplicate of filepath, starting at a different point
+    with TemporaryDirectory() as tmp_dir:
+        if duration is not None:
+            output = shift_result(output, time_offset, duration)
+        if time_offset != 0.0:
+            drumtrack_path = shift_drumtrack(
+                drumtrack_path,
+                time_offset,
+                duration,
+                Path(tmp_dir) / f"{filepath.stem}_drums.wav",
+            )
+        mp3_drumtrack_path = compress_to_mp3(drumtrack_path)
+
+        zip_path = get_result_path(filepath, output_dir)
+        with ZipFile(zip_path, "w") as zipf:
+            zipf.writestr(
+                f"{filepath.stem.replace(' ', '_').replace('-', '_')}.json",
+                json.dumps(output, indent=4),
+            )
+            zipf.write(filepath, arcname=filepath.name)
+            zipf.write(mp3_drumtrack_path, arcname=f"{filepath.stem}_drums.mp3")
 
     print(f"Exported results to: {zip_path}")
     return zip_path
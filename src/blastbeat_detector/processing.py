@@ -1,3 +1,5 @@
+import json
+from collections import deque
 from pathlib import Path
 from typing import NamedTuple
 
@@ -5,9 +7,19 @@ import numpy as np
 from numpy.fft import fft
 
 from blastbeat_detector.downloading import download_from_youtube_as_mp3
-from blastbeat_detector.extraction import extract_drums
+from blastbeat_detector.extraction import (
+    extract_drums,
+    get_audio_duration,
+    read_audio_file,
+)
+from blastbeat_detector.fingerprinting import (
+    compute_fingerprint,
+    find_matching_recording,
+    register_recording,
+    register_result,
+)
 from blastbeat_detector.plotting import plot_fft_with_markers
-from blastbeat_detector.postprocessing import save_result
+from blastbeat_detector.postprocessing import get_result, save_result
 
 
 class LabeledSection(NamedTuple):
@@ -17,6 +29,12 @@ class LabeledSection(NamedTuple):
     bass_drum_present: bool
 
 
+class ProcessingReport(NamedTuple):
+    result_path: str
+    deduplicated_from: str | None
+    saved_separation_time: float | None  # None when the original separation time is unknown
+
+
 def get_frequency_and_intensity_arrays(
     audio_data: np.ndarray, sample_rate: float
 ) -> tuple[np.ndarray, np.ndarray]:
@@ -54,6 +72,39 @@ def is_peak_present_around_frequency(
     return intensity_sum > peak_detection_min_area_threshold
 
 
+def label_section(
+    start_idx: int,
+    end_idx: int,
+    frequencies: np.ndarray,
+    intensities: np.ndarray,
+    bass_drum_freq: float,
+    snare_drum_freq: float,
+    peak_detection_band_width: float,
+    peak_detection_min_area_threshold: float,
+) -> LabeledSection:
+    snare_present = is_peak_present_around_frequency(
+        snare_drum_freq,
+        frequencies,
+        intensities,
+        peak_detection_band_width,
+        peak_detection_min_area_threshold,
+    )
+    bass_drum_present = is_peak_present_around_frequency(
+        bass_drum_freq,
+        frequencies,
+        intensities,
+        peak_detection_band_width,
+        peak_detection_min_area_threshold,
+    )
+
+    return LabeledSection(
+        start_idx,
+        end_idx,
+        snare_present=snare_present,
+        bass_drum_present=bass_drum_present,
+    )
+
+
 def get_sections_labeled_by_percussion_content_from_audio(
     time: np.ndarray,
     data: np.ndarray,
@@ -76,31 +127,118 @@ def get_sections_labeled_by_percussion_content_from_audio(
             data_range, sample_rate
         )
 
-        snare_present = is_peak_present_around_frequency(
-            snare_drum_freq,
-            freq,
-            fft_magnitude,
-            peak_detection_band_width,
-            peak_detection_min_area_threshold,
+        results.append(
+            label_section(
+                start_idx,
+                end_idx,
+                freq,
+                fft_magnitude,
+                bass_drum_freq,
+                snare_drum_freq,
+                peak_detection_band_width,
+                peak_detection_min_area_threshold,
+            )
         )
-        bass_drum_present = is_peak_present_around_frequency(
-            bass_drum_freq,
-            freq,
-            fft_magnitude,
-            peak_detection_band_width,
-            peak_detection_min_area_threshold,
+
+    return results
+
+
+def get_sections_labeled_by_percussion_content_with_frequency_tracking(
+    time: np.ndarray,
+    data: np.ndarray,
+    sample_rate: float,
+    bass_drum_range: tuple[int, int],
+    snare_range: tuple[int, int],
+    step_size_in_seconds: float,
+    tracking_horizon_in_seconds: float,
+    peak_detection_band_width: float,
+    peak_detection_min_area_threshold: float,
+) -> tuple[list[LabeledSection], list[tuple[float, float]]]:
+    # Same as get_sections_labeled_by_percussion_content_from_audio, but the bass drum & snare frequencies are
+    # re-estimated for every section from the spectrum accumulated over a horizon centered on it, instead of using a
+    # single pair for the whole song (compilations, kit changes, re-tuned sections...).
+    # The accumulated spectrum is updated incrementally as sections enter & leave the horizon, reusing the FFTs that
+    # are computed for labeling anyway, so the cost stays close to the fixed-frequency approach.
+    sections = []
+    tracked_frequencies = []
+
+    step_size_in_samples = int(step_size_in_seconds * sample_rate)
+    half_horizon_in_steps = max(
+        0, round(tracking_horizon_in_seconds / step_size_in_seconds / 2)
+    )
+
+    # all full-size sections share the same frequency bins, so their spectra can be summed directly
+    running_freq = (
+        np.arange(step_size_in_samples // 2) * sample_rate / step_size_in_samples
+    )
+    running_intensities = np.zeros(len(running_freq))
+    bass_drum_idx = np.where(
+        (running_freq >= bass_drum_range[0]) & (running_freq <= bass_drum_range[1])
+    )[0]
+    snare_idx = np.where(
+        (running_freq >= snare_range[0]) & (running_freq <= snare_range[1])
+    )[0]
+
+    if bass_drum_idx.size == 0 or snare_idx.size == 0:
+        raise ValueError(
+            "Bass drum or snare range too narrow for the given step size. Please increase step_size_in_seconds."
         )
 
-        results.append(
-            LabeledSection(
+    horizon = deque()
+    pending = deque()
+
+    def label_center_section(center_idx: int):
+        # drop the sections that fell out of the horizon of the one being labeled
+        while horizon and horizon[0][0] < center_idx - half_horizon_in_steps:
+            running_intensities[:] -= horizon.popleft()[1]
+
+        bass_drum_freq = running_freq[
+            bass_drum_idx[np.argmax(running_intensities[bass_drum_idx])]
+        ]
+        snare_freq = running_freq[snare_idx[np.argmax(running_intensities[snare_idx])]]
+
+        start_idx, end_idx, freq, fft_magnitude = pending.popleft()
+        sections.append(
+            label_section(
                 start_idx,
                 end_idx,
-                snare_present=snare_present,
-                bass_drum_present=bass_drum_present,
+                freq,
+                fft_magnitude,
+                bass_drum_freq,
+                snare_freq,
+                peak_detection_band_width,
+                peak_detection_min_area_threshold,
             )
         )
+        tracked_frequencies.append((bass_drum_freq, snare_freq))
 
-    return results
+    for i, start_idx in enumerate(range(0, len(time), step_size_in_samples)):
+        end_idx = start_idx + step_size_in_samples
+        data_range = data[start_idx:end_idx]
+
+        freq, fft_magnitude = get_frequency_and_intensity_arrays(
+            data_range, sample_rate
+        )
+        pending.append((start_idx, end_idx, freq, fft_magnitude))
+
+        if len(data_range) == step_size_in_samples:
+            horizon_intensities = fft_magnitude
+        else:
+            # last section is shorter: zero-pad it so it lands on the same bins
+            _, horizon_intensities = get_frequency_and_intensity_arrays(
+                np.pad(data_range, (0, step_size_in_samples - len(data_range))),
+                sample_rate,
+            )
+        running_intensities += horizon_intensities
+        horizon.append((i, horizon_intensities))
+
+        if i >= half_horizon_in_steps:
+            label_center_section(i - half_horizon_in_steps)
+
+    while pending:
+        label_center_section(len(sections))
+
+    return sections, tracked_frequencies
 
 
 def identify_blastbeats(
@@ -175,6 +313,85 @@ def identify_bass_and_snare_frequencies(
     return bass_drum_freq, snare_freq
 
 
+def analyze_drumtrack(
+    time: np.ndarray,
+    audio_data: np.ndarray,
+    sample_rate: float,
+    peak_detection_band_width: float,
+    peak_detection_min_area_threshold: float,
+    step_size_in_seconds: float,
+    bass_drum_range: tuple[int, int],
+    snare_range: tuple[int, int],
+    min_consecutive_hits: int,
+    frequency_tracking_horizon_in_seconds: float | None,
+) -> dict:
+    tracked_frequencies = None
+    if frequency_tracking_horizon_in_seconds is None:
+        bass_drum_freq, snare_freq = identify_bass_and_snare_frequencies(
+            audio_data,
+            sample_rate,
+            bass_drum_range,
+            snare_range
+        )
+        print(
+            f"Estimated frequencies -- Bass drum: {bass_drum_freq} Hz; Snare drum: {snare_freq} Hz"
+        )
+
+        print("Identifying blast beats...")
+        labeled_sections = get_sections_labeled_by_percussion_content_from_audio(
+            time,
+            audio_data,
+            sample_rate,
+            bass_drum_freq,
+            snare_freq,
+            step_size_in_seconds,
+            peak_detection_band_width,
+            peak_detection_min_area_threshold,
+        )
+    else:
+        print(
+            f"Identifying blast beats, tracking frequencies over {frequency_tracking_horizon_in_seconds}s..."
+        )
+        labeled_sections, tracked_frequencies = (
+            get_sections_labeled_by_percussion_content_with_frequency_tracking(
+                time,
+                audio_data,
+                sample_rate,
+                bass_drum_range,
+                snare_range,
+                step_size_in_seconds,
+                frequency_tracking_horizon_in_seconds,
+                peak_detection_band_width,
+                peak_detection_min_area_threshold,
+            )
+        )
+        # overall estimate, for reporting only
+        bass_drum_freq = float(np.median([f[0] for f in tracked_frequencies]))
+        snare_freq = float(np.median([f[1] for f in tracked_frequencies]))
+        print(
+            f"Median tracked frequencies -- Bass drum: {bass_drum_freq} Hz; Snare drum: {snare_freq} Hz"
+        )
+
+    blastbeat_intervals = identify_blastbeats(labeled_sections, min_consecutive_hits)
+
+    return get_result(
+        time,
+        blastbeat_intervals,
+        snare_freq,
+        bass_drum_freq,
+        tracked_frequencies=(
+            None
+            if tracked_frequencies is None
+            else [
+                (section.start_idx, section.end_idx, bass, snare)
+                for section, (bass, snare) in zip(
+                    labeled_sections, tracked_frequencies
+                )
+            ]
+        ),
+    )
+
+
 def process_song(
     file_path: Path,
     peak_detection_band_width=10.0,
@@ -182,38 +399,71 @@ def process_song(
     step_size_in_seconds=0.15,
     bass_drum_range=(10, 100),
     snare_range=(170, 600),
-    min_consecutive_hits=8
-):
+    min_consecutive_hits=8,
+    frequency_tracking_horizon_in_seconds=None,
+) -> ProcessingReport:
     output_dir = Path.cwd().resolve() / "output"
     output_dir.mkdir(exist_ok=True)
 
-    (time, audio_data, sample_rate), drumtrack_path = extract_drums(file_path)
-    bass_drum_freq, snare_freq = identify_bass_and_snare_frequencies(
-        audio_data,
-        sample_rate,
-        bass_drum_range,
-        snare_range
-    )
-    print(
-        f"Estimated frequencies -- Bass drum: {bass_drum_freq} Hz; Snare drum: {snare_freq} Hz"
-    )
+    analysis_parameters = {
+        "peak_detection_band_width": peak_detection_band_width,
+        "peak_detection_min_area_threshold": peak_detection_min_area_threshold,
+        "step_size_in_seconds": step_size_in_seconds,
+        "bass_drum_range": bass_drum_range,
+        "snare_range": snare_range,
+        "min_consecutive_hits": min_consecutive_hits,
+        "frequency_tracking_horizon_in_seconds": frequency_tracking_horizon_in_seconds,
+    }
+    analysis_key = json.dumps(analysis_parameters, sort_keys=True)
+
+    # Same recording (different URL, file name, encoding...) already separated -> reuse its drum track
+    fingerprint = compute_fingerprint(file_path)
+    match = find_matching_recording(fingerprint)
+    deduplicated_from, saved_separation_time, time_offset = None, 0.0, 0.0
+    audio = None
+    if match is not None:
+        drumtrack_path = match.drums_path
+        time_offset = match.time_offset
+        # a re-run of the very same file (however its path was written) doesn't count as a duplicate
+        if str(file_path.resolve()) not in match.sources:
+            deduplicated_from = match.sources[0]
+            saved_separation_time = match.separation_time
+            print(
+                f"Same recording as '{match.sources[0]}' (similarity: {match.similarity:.2f}), "
+                "reusing its drum track."
+                + (
+                    f" Saved ~{saved_separation_time:.1f}s of separation."
+                    if saved_separation_time is not None
+                    else ""
+                )
+            )
+    else:
+        audio, drumtrack_path, separation_time = extract_drums(file_path)
+        register_recording(fingerprint, file_path, drumtrack_path, separation_time)
 
-    print("Identifying blast beats...")
-    labeled_sections = get_sections_labeled_by_percussion_content_from_audio(
-        time,
-        audio_data,
-        sample_rate,
-        bass_drum_freq,
-        snare_freq,
-        step_size_in_seconds,
-        peak_detection_band_width,
-        peak_detection_min_area_threshold,
+    # results are kept on the drum track's timeline & shifted onto this file's one when exporting
+    result = match.results.get(analysis_key) if match is not None else None
+    if result is not None:
+        print("Reusing previous results for the same recording & parameters.")
+    else:
+        if audio is None:
+            audio = read_audio_file(drumtrack_path)
+        time, audio_data, sample_rate = audio
+        result = analyze_drumtrack(
+            time, audio_data, sample_rate, **analysis_parameters
+        )
+    register_result(drumtrack_path, file_path, analysis_key, result)
+
+    zip_path = save_result(
+        result,
+        file_path,
+        drumtrack_path,
+        output_dir.as_posix(),
+        time_offset=time_offset,
+        duration=get_audio_duration(file_path),
     )
-    blastbeat_intervals = identify_blastbeats(labeled_sections, min_consecutive_hits)
 
-    save_result(
-        time, blastbeat_intervals, snare_freq, bass_drum_freq, file_path, drumtrack_path, output_dir.as_posix()
-    )
+    return ProcessingReport(zip_path, deduplicated_from, saved_separation_time)
 
 
 if __name__ == "__main__":
@@ -222,6 +472,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--file", type=str)
     parser.add_argument("--url", type=str)
+    parser.add_argument("--frequency-tracking-horizon", type=float)
     args = parser.parse_args()
 
     if args.file:
@@ -239,4 +490,7 @@ if __name__ == "__main__":
             "You must provide either a local file path (--file) or a url to download from YouTube (--url)"
         )
 
-    process_song(file_path)
+    process_song(
+        file_path,
+        frequency_tracking_horizon_in_seconds=args.frequency_tracking_horizon,
+    )
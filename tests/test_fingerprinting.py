@@ -0,0 +1,237 @@
+from pathlib import Path
+
+import json
+from io import BytesIO
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import blastbeat_detector.postprocessing
+import blastbeat_detector.processing
+from blastbeat_detector.extraction import read_audio_file
+from blastbeat_detector.fingerprinting import (
+    MIN_SIMILARITY,
+    compute_fingerprint,
+    find_matching_recording,
+    frames_to_seconds,
+    get_fingerprint_similarity,
+    register_recording,
+    register_result,
+)
+from blastbeat_detector.processing import process_song
+
+SAMPLE_RATE = 22050
+
+
+def generate_song(seed, duration_in_seconds=30):
+    # random "melody" of 0.3s notes, with a noise burst every other note
+    rng = np.random.default_rng(seed)
+    time = np.arange(duration_in_seconds * SAMPLE_RATE) / SAMPLE_RATE
+    song = 0.05 * rng.standard_normal(len(time))
+    note_length = int(0.3 * SAMPLE_RATE)
+    for i, start in enumerate(range(0, len(time), note_length)):
+        note = slice(start, start + note_length)
+        frequency = 110 * 2 ** (rng.integers(0, 24) / 12)
+        song[note] += np.sin(2 * np.pi * frequency * time[note])
+        if i % 2 == 0:
+            burst = song[start : start + 500]
+            burst += rng.standard_normal(len(burst))
+    return song
+
+
+def test_fingerprint_similarity():
+    rng = np.random.default_rng(0)
+    fingerprint = rng.integers(0, 2**24, 500, dtype=np.uint32)
+
+    # same recording, starting 10 frames later & with some flipped bits (e.g. re-encoded)
+    shifted = np.concatenate(
+        [rng.integers(0, 2**24, 10, dtype=np.uint32), fingerprint]
+    )
+    shifted[::7] ^= np.uint32(0b101)
+    unrelated = rng.integers(0, 2**24, 500, dtype=np.uint32)
+    clip = fingerprint[:100]
+    # e.g. a 60s grind track re-uploaded with 10s more of intro
+    longer_intro = np.concatenate(
+        [rng.integers(0, 2**24, 200, dtype=np.uint32), fingerprint]
+    )
+
+    assert get_fingerprint_similarity(fingerprint, fingerprint) == (1.0, 0)
+    similarity, offset = get_fingerprint_similarity(shifted, fingerprint)
+    assert similarity >= MIN_SIMILARITY
+    assert offset == 10
+    assert get_fingerprint_similarity(fingerprint, unrelated)[0] < MIN_SIMILARITY
+    assert get_fingerprint_similarity(fingerprint, clip)[0] == 0.0
+    assert get_fingerprint_similarity(longer_intro, fingerprint) == (1.0, 200)
+
+
+@pytest.mark.parametrize("lead_in_in_seconds", [0.02, 0.2, 1.3])
+def test_fingerprint_survives_lead_in_not_aligned_to_frames(
+    tmp_path, lead_in_in_seconds
+):
+    song = generate_song(1)
+    sf.write(tmp_path / "original.wav", song, SAMPLE_RATE)
+    # different lead-in, volume & a bit of noise
+    reupload = np.concatenate(
+        [np.zeros(int(lead_in_in_seconds * SAMPLE_RATE)), 0.5 * song]
+    )
+    reupload += 0.01 * np.random.default_rng(2).standard_normal(len(reupload))
+    sf.write(tmp_path / "reupload.wav", reupload, SAMPLE_RATE)
+    sf.write(tmp_path / "unrelated.wav", generate_song(3), SAMPLE_RATE)
+
+    original = compute_fingerprint(tmp_path / "original.wav")
+    similarity, offset = get_fingerprint_similarity(
+        compute_fingerprint(tmp_path / "reupload.wav"), original
+    )
+    assert similarity >= MIN_SIMILARITY
+    assert frames_to_seconds(offset) == pytest.approx(lead_in_in_seconds, abs=0.05)
+
+    similarity, _ = get_fingerprint_similarity(
+        compute_fingerprint(tmp_path / "unrelated.wav"), original
+    )
+    assert similarity < MIN_SIMILARITY
+
+
+def test_fingerprint_index_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    fingerprint = rng.integers(0, 2**24, 500, dtype=np.uint32)
+    (tmp_path / "song.mp3").touch()
+    (tmp_path / "song_drums.wav").touch()
+
+    assert find_matching_recording(fingerprint) is None
+
+    register_recording(
+        fingerprint, Path("song.mp3"), Path("song_drums.wav"), separation_time=42.0
+    )
+    # same file given with an absolute path, drum track already there
+    register_recording(
+        fingerprint, tmp_path / "song.mp3", tmp_path / "song_drums.wav", None
+    )
+    register_result(
+        tmp_path / "song_drums.wav", Path("song.mp3"), "key", {"blast_beats": []}
+    )
+
+    match = find_matching_recording(fingerprint)
+    assert match.drums_path == (tmp_path / "song_drums.wav").resolve()
+    assert match.sources == [str((tmp_path / "song.mp3").resolve())]
+    assert match.separation_time == 42.0
+    assert match.results == {"key": {"blast_beats": []}}
+    assert match.similarity == 1.0
+    assert match.time_offset == 0.0
+
+    assert (
+        find_matching_recording(rng.integers(0, 2**24, 500, dtype=np.uint32))
+        is None
+    )
+
+    # found through the lookup table among other recordings, along with its offset
+    (tmp_path / "other_drums.wav").touch()
+    register_recording(
+        rng.integers(0, 2**24, 500, dtype=np.uint32),
+        Path("other.mp3"),
+        Path("other_drums.wav"),
+        None,
+    )
+    reupload = np.concatenate(
+        [rng.integers(0, 2**24, 30, dtype=np.uint32), fingerprint]
+    )
+    reupload[::3] ^= np.uint32(1)
+    match = find_matching_recording(reupload)
+    assert match.drums_path == (tmp_path / "song_drums.wav").resolve()
+    assert match.time_offset == frames_to_seconds(30)
+
+
+def test_process_song_reuses_drum_track_and_results_of_duplicates(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    separated = []
+
+    def fake_extract_drums(input_file_path):
+        # "drum track" with a blast beat (60Hz bass drum + 300Hz snare) between 10s & 15s
+        separated.append(input_file_path)
+        time = np.arange(30 * SAMPLE_RATE) / SAMPLE_RATE
+        drums = np.where(
+            (time >= 10) & (time < 15),
+            np.sin(2 * np.pi * 60 * time) + np.sin(2 * np.pi * 300 * time),
+            0,
+        )
+        drums_path = input_file_path.parent / f"{input_file_path.stem}_drums.wav"
+        sf.write(drums_path, drums, SAMPLE_RATE)
+        return read_audio_file(drums_path), drums_path, 42.0
+
+    monkeypatch.setattr(
+        blastbeat_detector.processing, "extract_drums", fake_extract_drums
+    )
+    monkeypatch.setattr(
+        blastbeat_detector.postprocessing, "compress_to_mp3", lambda path: path
+    )
+
+    def read_blast_beats(zip_path, name, drums_onset):
+        with ZipFile(zip_path) as zipf:
+            assert sorted(zipf.namelist()) == [
+                f"{name}.json",
+                f"{name}.wav",
+                f"{name}_drums.mp3",
+            ]
+            # the exported drum track is on the same timeline as the json times
+            drums, _ = sf.read(BytesIO(zipf.read(f"{name}_drums.mp3")))
+            assert np.argmax(np.abs(drums) > 0.5) / SAMPLE_RATE == pytest.approx(
+                drums_onset, abs=0.05
+            )
+            return [
+                time
+                for b in json.loads(zipf.read(f"{name}.json"))["blast_beats"]
+                for time in (b["start_time"], b["end_time"])
+            ]
+
+    song = generate_song(1)
+    sf.write(tmp_path / "Original.wav", song, SAMPLE_RATE)
+    # re-upload with 0.2s more of lead-in, and one missing the first 5s
+    sf.write(
+        tmp_path / "Reupload.wav",
+        np.concatenate([np.zeros(int(0.2 * SAMPLE_RATE)), song]),
+        SAMPLE_RATE,
+    )
+    sf.write(tmp_path / "Trimmed.wav", song[5 * SAMPLE_RATE :], SAMPLE_RATE)
+    sf.write(tmp_path / "Copy.wav", song, SAMPLE_RATE)
+
+    report = process_song(tmp_path / "Original.wav")
+    original_blast_beats = read_blast_beats(report.result_path, "Original", 10)
+    assert len(original_blast_beats) > 0
+    assert report.deduplicated_from is None
+
+    # same file, relative path: not a duplicate
+    report = process_song(Path("Original.wav"))
+    assert report.deduplicated_from is None
+    assert report.saved_separation_time == 0.0
+
+    # previous results reused, on the reupload's timeline
+    report = process_song(tmp_path / "Reupload.wav")
+    assert report.deduplicated_from == str((tmp_path / "Original.wav").resolve())
+    assert report.saved_separation_time == 42.0
+    assert read_blast_beats(report.result_path, "Reupload", 10.2) == pytest.approx(
+        [t + 0.2 for t in original_blast_beats], abs=0.05
+    )
+
+    # different parameters: analyzed again on the original's drum track, on the reupload's timeline
+    report = process_song(tmp_path / "Reupload.wav", min_consecutive_hits=4)
+    reupload_blast_beats = read_blast_beats(report.result_path, "Reupload", 10.2)
+    assert len(reupload_blast_beats) > len(original_blast_beats)
+    assert reupload_blast_beats[0] == pytest.approx(
+        original_blast_beats[0] + 0.2, abs=0.05
+    )
+
+    # results of a duplicate missing part of the recording don't affect later duplicates
+    report = process_song(tmp_path / "Trimmed.wav")
+    assert read_blast_beats(report.result_path, "Trimmed", 5) == pytest.approx(
+        [max(0.0, t - 5) for t in original_blast_beats], abs=0.05
+    )
+    report = process_song(tmp_path / "Copy.wav")
+    assert read_blast_beats(report.result_path, "Copy", 10) == pytest.approx(
+        original_blast_beats, abs=0.05
+    )
+
+    assert separated == [tmp_path / "Original.wav"]
@@ -0,0 +1,41 @@
+from blastbeat_detector.postprocessing import shift_result
+
+
+def test_shift_result_clips_to_duplicate_timeline():
+    result = {
+        "blast_beats": [
+            {"start_time": 1.0, "end_time": 3.0},
+            {"start_time": 10.0, "end_time": 20.0},
+            {"start_time": 28.0, "end_time": 29.0},
+        ],
+        "snare_frequency": 300.0,
+        "bass_drum_frequency": 60.0,
+        "tracked_frequencies": [
+            {
+                "start_time": 0.0,
+                "end_time": 4.0,
+                "bass_drum_frequency": 60.0,
+                "snare_frequency": 300.0,
+            },
+            {
+                "start_time": 4.0,
+                "end_time": 29.9,
+                "bass_drum_frequency": 80.0,
+                "snare_frequency": 250.0,
+            },
+        ],
+    }
+
+    # duplicate missing the first 5s & the last 3s of the recording
+    shifted = shift_result(result, -5.0, 22.0)
+
+    assert shifted["blast_beats"] == [{"start_time": 5.0, "end_time": 15.0}]
+    assert shifted["tracked_frequencies"] == [
+        {
+            "start_time": 0.0,
+            "end_time": 22.0,
+            "bass_drum_frequency": 80.0,
+            "snare_frequency": 250.0,
+        }
+    ]
+    assert result["blast_beats"][0] == {"start_time": 1.0, "end_time": 3.0}
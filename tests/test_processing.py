@@ -1,4 +1,10 @@
-from blastbeat_detector.processing import LabeledSection, identify_blastbeats
+import numpy as np
+
+from blastbeat_detector.processing import (
+    LabeledSection,
+    get_sections_labeled_by_percussion_content_with_frequency_tracking,
+    identify_blastbeats,
+)
 
 
 def test_identify_blasts_1():
@@ -35,3 +41,33 @@ def test_identify_blasts_2():
     actual = identify_blastbeats(input, 8)
 
     assert actual == expected
+
+
+def test_frequency_tracking_follows_kit_change():
+    sample_rate = 8000
+    time = np.arange(20 * sample_rate) / sample_rate
+    # first half: 60Hz bass drum & 300Hz snare; second half: 80Hz bass drum & 240Hz snare
+    data = np.where(
+        time < 10,
+        np.sin(2 * np.pi * 60 * time) + np.sin(2 * np.pi * 300 * time),
+        np.sin(2 * np.pi * 80 * time) + np.sin(2 * np.pi * 240 * time),
+    )
+
+    sections, tracked_frequencies = (
+        get_sections_labeled_by_percussion_content_with_frequency_tracking(
+            time,
+            data,
+            sample_rate,
+            bass_drum_range=(10, 100),
+            snare_range=(170, 600),
+            step_size_in_seconds=0.1,
+            tracking_horizon_in_seconds=2,
+            peak_detection_band_width=10.0,
+            peak_detection_min_area_threshold=37.6,
+        )
+    )
+
+    assert len(sections) == len(tracked_frequencies) == 200
+    assert tracked_frequencies[0] == (60, 300)
+    assert tracked_frequencies[-1] == (80, 240)
+    assert all(s.snare_present and s.bass_drum_present for s in sections)